@@ -1,16 +1,36 @@
-from fastapi import APIRouter, HTTPException, Query, Depends, Security
-from typing import List, Optional
+import asyncio
+import logging
+from fastapi import APIRouter, Body, HTTPException, Query, Depends, Security
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import AsyncIterator, List, Optional
 from uuid import UUID
 
-from ...models.character import Character, CharacterCreate, ImageVariation
-from ...services.image_generator import generate_character_image
-from ...db.file_storage import save_character, get_character, get_all_characters, update_character, delete_character
+from ...models.character import Character, CharacterCreate, CharacterSummary, ImageVariation, VariationRequest
+from ...services.image_generator import generate_character_image, forget_character_images
 from ...core.security import get_api_key
+from ...core.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+if settings.STORAGE_BACKEND == "json":
+    from ...db.file_storage import save_character, get_character, iter_characters_json, update_character, delete_character
+else:
+    from ...db.sqlite_storage import save_character, get_character, iter_characters_json, update_character, delete_character
+
+async def _json_array(items: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Wrap a stream of encoded JSON values into a JSON array."""
+    yield b"["
+    first = True
+    async for item in items:
+        yield item if first else b"," + item
+        first = False
+    yield b"]"
 
 router = APIRouter(
     prefix="/api/characters",
     tags=["characters"],
-    dependencies=[Security(get_api_key)]  # Apply API key security to all routes in this router
+    dependencies=[Security(get_api_key)],  # Apply API key security to all routes in this router
+    default_response_class=ORJSONResponse
 )
 
 @router.post("/", response_model=Character, status_code=201)
@@ -30,7 +50,7 @@ async def create_character(character_data: CharacterCreate):
     # Note: new_character.image_seed was set in generate_character_image
 
     # Save character to storage
-    saved_character = save_character(new_character)
+    saved_character = await save_character(new_character)
     return saved_character
 
 @router.get("/{character_id}", response_model=Character)
@@ -38,17 +58,21 @@ async def read_character_by_id(character_id: UUID):
     """
     Retrieve a specific character by its ID.
     """
-    character = get_character(character_id)
+    character = await get_character(character_id)
     if not character:
         raise HTTPException(status_code=404, detail="Character not found")
     return character
 
-@router.get("/", response_model=List[Character])
-async def read_characters():
+@router.get("/", response_model=List[CharacterSummary])
+async def read_characters(
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of characters to return"),
+    offset: int = Query(0, ge=0, description="Number of characters to skip (newest first)")
+):
     """
-    Retrieve a list of all characters.
+    Retrieve a list of all characters, newest first (without variations; fetch a character by ID for those).
+    The JSON array is streamed as characters are read from storage rather than built in memory first.
     """
-    return get_all_characters()
+    return StreamingResponse(_json_array(iter_characters_json(limit=limit, offset=offset)), media_type="application/json")
 
 @router.post("/{character_id}/variations", response_model=Character)
 async def create_character_variation(
@@ -61,7 +85,7 @@ async def create_character_variation(
     Generate a new image variation for an existing character based on pose, expression, or setting.
     Uses the same seed as the base image for consistent appearance.
     """
-    character = get_character(character_id)
+    character = await get_character(character_id)
     if not character:
         raise HTTPException(status_code=404, detail="Character not found")
 
@@ -81,6 +105,10 @@ async def create_character_variation(
     if not image_path:
         raise HTTPException(status_code=500, detail="Failed to generate variation image.")
 
+    # A cached generation returns a path the character already has; don't list it twice
+    if any(v.image_path == image_path for v in character.variations):
+        return character
+
     # Create variation object
     variation = ImageVariation(
         image_path=image_path,
@@ -91,7 +119,56 @@ async def create_character_variation(
     character.variations.append(variation)
 
     # Update the character in storage (this also updates 'updated_at')
-    updated_character = update_character(character)
+    updated_character = await update_character(character)
+    if not updated_character:
+         raise HTTPException(status_code=404, detail="Character not found during update process.")
+
+    return updated_character
+
+@router.post("/{character_id}/variations/batch", response_model=Character)
+async def create_character_variations_batch(
+    character_id: UUID,
+    variations: List[VariationRequest] = Body(..., max_length=settings.MAX_BATCH_VARIATIONS)
+):
+    """
+    Generate several image variations (at most MAX_BATCH_VARIATIONS) for an existing character concurrently.
+    Each entry needs at least one of pose, expression or setting. Variations that fail to
+    generate are skipped; the character is saved once with all successful ones.
+    """
+    character = await get_character(character_id)
+    if not character:
+        raise HTTPException(status_code=404, detail="Character not found")
+
+    if not variations:
+        raise HTTPException(status_code=400, detail="At least one variation must be provided")
+
+    # Drop unset parameters, as the single-variation endpoint does
+    active_params_list = [v.model_dump(exclude_none=True) for v in variations]
+    if not all(active_params_list):
+        raise HTTPException(status_code=400, detail="Each variation must provide at least one parameter (pose, expression, setting)")
+
+    results = await asyncio.gather(
+        *(generate_character_image(character, params) for params in active_params_list),
+        return_exceptions=True
+    )
+
+    generated = 0
+    known_paths = {v.image_path for v in character.variations}
+    for params, result in zip(active_params_list, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Variation {params} for character {character_id} failed: {result}")
+            continue
+        generated += 1
+        if result in known_paths:
+            continue  # Cached generation already listed on the character
+        known_paths.add(result)
+        character.variations.append(ImageVariation(image_path=result, **params))
+
+    if not generated:
+        raise HTTPException(status_code=500, detail="Failed to generate any variation images.")
+
+    # Single storage write for the whole batch
+    updated_character = await update_character(character)
     if not updated_character:
          raise HTTPException(status_code=404, detail="Character not found during update process.")
 
@@ -102,7 +179,8 @@ async def remove_character(character_id: UUID):
     """
     Delete a character and all its associated image files.
     """
-    deleted = delete_character(character_id)
+    deleted = await delete_character(character_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Character not found")
+    await forget_character_images(character_id)
     return None 
\ No newline at end of file
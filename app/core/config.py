@@ -8,6 +8,10 @@ class Settings(BaseSettings):
     STATIC_FILES_DIR: str = "static"
     IMAGE_STORAGE_PATH: str = os.path.join(STATIC_FILES_DIR, "images")
     API_KEY: str = "default-secret-key-please-change"  # Default that should be overridden in .env
+    STORAGE_BACKEND: str = "sqlite"  # "sqlite" or "json" (legacy characters_db.json file)
+    DATABASE_PATH: str = "characters.db"
+    MAX_INFLIGHT: int = 64  # Concurrent /api/characters requests before answering 503
+    MAX_BATCH_VARIATIONS: int = 10  # Image generations a single batch request may start
 
     class Config:
         env_file = ".env"
@@ -1,120 +1,257 @@
-import json
+import anyio
+import asyncio
+import bisect
+import orjson
 import os
 import shutil
 import logging
-from typing import List, Optional, Dict
+import threading
+from typing import AsyncIterator, List, Optional, Dict, Tuple
 from uuid import UUID
-from datetime import datetime
 from fastapi import HTTPException
 
-from ..models.character import Character
+from ..models.character import Character, CharacterSummary, utcnow
 from ..core.config import get_settings
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # NOTE: This file-based storage is simple for MVP but has limitations:
-# 1. Race Conditions: Multiple simultaneous writes can corrupt data.
+# 1. Race Conditions: Writes are serialized with a lock file and replace the file
+#    atomically, but concurrent read-modify-write cycles in separate worker
+#    processes can still lose each other's changes.
 # 2. Scalability: Reading/writing the entire file on each operation is inefficient.
-# Consider migrating to a database (e.g., SQLite, PostgreSQL) for future versions.
+#    Updates are therefore coalesced and written behind (see update_character);
+#    call flush() before shutdown so none are lost.
+# The SQLite backend (sqlite_storage.py, the default) avoids both.
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 STORAGE_FILE = "characters_db.json"
+LOCK_FILE = STORAGE_FILE + ".lock"
 
-def _read_storage() -> Dict[UUID, Character]:
-    """Read all characters from storage file. Returns empty dict on error or if file not found."""
-    if not os.path.exists(STORAGE_FILE):
-        return {}
+# Parsed contents of STORAGE_FILE, keyed by the file's mtime so that reads skip
+# re-parsing until the file changes (including writes from other processes).
+# Alongside the characters we keep a newest-first index of (-created_at, id)
+# entries, maintained on each write so listing never has to sort.
+SortedIndex = List[Tuple[float, UUID]]
+_CACHE: Optional[Tuple[int, Dict[UUID, Character], SortedIndex]] = None
+_cache_lock = threading.Lock()
+# Serializes read-modify-write cycles between coroutines in this process
+_write_lock = asyncio.Lock()
+
+# Write-behind buffer: updates to existing characters collected here are written
+# together by one delayed flush, so a burst of updates costs a single file write.
+WRITE_BEHIND_DELAY = 0.05  # seconds
+WRITE_BEHIND_RETRY_DELAY = 1.0  # seconds before retrying a failed flush
+_PENDING: Dict[UUID, Character] = {}
+_FLUSH_TASK: Optional[asyncio.Task] = None
+
+def _index_key(character: Character) -> Tuple[float, UUID]:
+    return (-character.created_at.timestamp(), character.id)
+
+async def _load_storage() -> Tuple[Dict[UUID, Character], SortedIndex]:
+    """Read all characters and the newest-first index. Returns empty ones on error or if file not found."""
+    global _CACHE
+    try:
+        mtime = os.stat(STORAGE_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return {}, []
+    with _cache_lock:
+        if _CACHE is not None and _CACHE[0] == mtime:
+            return _CACHE[1], _CACHE[2]
     try:
-        with open(STORAGE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            # Parse character objects, handling potential errors
-            characters = {}
-            for k, v in data.items():
-                try:
-                    characters[UUID(k)] = Character.model_validate(v)  # Use model_validate for Pydantic v2
-                except Exception as parse_error:
-                    logger.error(f"Failed to parse character data for key {k}: {parse_error}")
-            return characters
-    except (json.JSONDecodeError, IOError) as e:
+        async with await anyio.open_file(STORAGE_FILE, "rb") as f:
+            data = orjson.loads(await f.read())
+        # Parse character objects, handling potential errors
+        characters = {}
+        for k, v in data.items():
+            try:
+                characters[UUID(k)] = Character.model_validate(v)  # Use model_validate for Pydantic v2
+            except Exception as parse_error:
+                logger.error(f"Failed to parse character data for key {k}: {parse_error}")
+        index = sorted(_index_key(c) for c in characters.values())
+        with _cache_lock:
+            _CACHE = (mtime, characters, index)
+        return characters, index
+    except (orjson.JSONDecodeError, IOError) as e:
         logger.error(f"Error reading storage file {STORAGE_FILE}: {e}")
         # Decide behavior: return empty / raise error / try to recover? For MVP, return empty.
-        return {}
+        return {}, []
+
+async def _read_storage() -> Dict[UUID, Character]:
+    """Read all characters from storage file. Returns empty dict on error or if file not found."""
+    characters, _ = await _load_storage()
+    return characters
+
+def _lock_exclusive(lock_file):
+    if fcntl:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    else:
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+
+def _unlock(lock_file):
+    if fcntl:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
 
-def _write_storage(characters: Dict[UUID, Character]):
-    """Write characters dictionary to storage file."""
+def _replace_storage_file(payload: bytes):
+    """Atomically replace STORAGE_FILE while holding the cross-process lock (runs in a worker thread)."""
+    tmp_file = STORAGE_FILE + ".tmp"
+    with open(LOCK_FILE, "w") as lock_file:
+        _lock_exclusive(lock_file)
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(payload)
+            # Readers see either the old or the new file, never a partial write
+            os.replace(tmp_file, STORAGE_FILE)
+        finally:
+            _unlock(lock_file)
+
+async def _write_storage(characters: Dict[UUID, Character], index: SortedIndex):
+    """Write characters dictionary to storage file and cache it with its sorted index."""
+    global _CACHE
     try:
-        with open(STORAGE_FILE, "w", encoding="utf-8") as f:
-            # Use model_dump for Pydantic v2
-            serialized = {str(k): v.model_dump(mode='json') for k, v in characters.items()}
-            json.dump(serialized, f, indent=4)  # Added indent for readability
-    except IOError as e:
+        # Dump to Python objects and let orjson encode UUID/datetime natively (no indent on the hot path)
+        serialized = {str(k): v.model_dump(mode='python') for k, v in characters.items()}
+        payload = orjson.dumps(serialized)
+        await anyio.to_thread.run_sync(_replace_storage_file, payload)
+        with _cache_lock:
+            _CACHE = (os.stat(STORAGE_FILE).st_mtime_ns, characters, index)
+    except (TypeError, IOError) as e:
+        # The cached dict may already hold the unsaved change; force a re-read
+        with _cache_lock:
+            _CACHE = None
         logger.error(f"Error writing to storage file {STORAGE_FILE}: {e}")
         # This is critical, maybe raise an exception?
         raise HTTPException(status_code=500, detail="Failed to save character data.")
 
 
-def save_character(character: Character) -> Character:
+async def save_character(character: Character) -> Character:
     """Save a new or updated character to storage."""
-    characters = _read_storage()
-    # Ensure created_at and updated_at are set if somehow missing (should be handled by model)
-    now = datetime.now()
-    if not character.created_at: character.created_at = now
-    character.updated_at = now  # Always set updated_at on save/update
-    characters[character.id] = character
-    _write_storage(characters)
+    async with _write_lock:
+        characters, index = await _load_storage()
+        # Ensure created_at and updated_at are set if somehow missing (should be handled by model)
+        now = utcnow()
+        if not character.created_at: character.created_at = now
+        character.updated_at = now  # Always set updated_at on save/update
+        if character.id in characters:
+            index[:] = [entry for entry in index if entry[1] != character.id]
+        bisect.insort(index, _index_key(character))
+        characters[character.id] = character
+        _PENDING.pop(character.id, None)  # Superseded by this write
+        await _write_storage(characters, index)
     logger.info(f"Character saved/updated: {character.id}")
     return character
 
-def get_character(character_id: UUID) -> Optional[Character]:
+async def get_character(character_id: UUID) -> Optional[Character]:
     """Get a character by ID."""
-    characters = _read_storage()
-    character = characters.get(character_id)
+    characters = await _read_storage()
+    character = _PENDING.get(character_id) or characters.get(character_id)
     if character:
         logger.info(f"Character retrieved: {character_id}")
     else:
         logger.warning(f"Character not found: {character_id}")
     return character
 
-def get_all_characters() -> List[Character]:
-    """Get all characters."""
-    characters = _read_storage()
-    logger.info(f"Retrieved {len(characters)} characters.")
-    # Sort by creation date or name? Optional enhancement.
-    return sorted(list(characters.values()), key=lambda c: c.created_at, reverse=True)
+async def get_all_characters(limit: Optional[int] = None, offset: int = 0) -> List[CharacterSummary]:
+    """Get characters newest first, optionally paginated. Callers only rely on the summary fields."""
+    characters, index = await _load_storage()
+    end = None if limit is None else offset + limit
+    page = [_PENDING.get(character_id) or characters[character_id] for _, character_id in index[offset:end]]
+    logger.info(f"Retrieved {len(page)} of {len(characters)} characters.")
+    return page
+
+async def iter_characters_json(limit: Optional[int] = None, offset: int = 0) -> AsyncIterator[bytes]:
+    """Yield character summaries as JSON objects, newest first, serializing one at a time."""
+    for character in await get_all_characters(limit=limit, offset=offset):
+        yield character.model_dump_json(exclude={"variations"}).encode()
 
 
-def update_character(character: Character) -> Optional[Character]:
-    """Update an existing character. Returns updated character or None if not found."""
-    characters = _read_storage()
+async def update_character(character: Character) -> Optional[Character]:
+    """Update an existing character. Returns updated character or None if not found.
+
+    The change is visible to reads immediately but written to disk by a flush
+    scheduled WRITE_BEHIND_DELAY later, coalesced with any other pending updates.
+    """
+    global _FLUSH_TASK
+    characters = await _read_storage()
     if character.id not in characters:
         logger.warning(f"Attempted to update non-existent character: {character.id}")
         return None  # Or raise HTTPException(status_code=404, ...)
 
     # Ensure updated_at is set on every update
-    character.updated_at = datetime.now()
-    characters[character.id] = character
-    _write_storage(characters)
+    character.updated_at = utcnow()
+    _PENDING[character.id] = character
+    if _FLUSH_TASK is None:
+        _FLUSH_TASK = asyncio.create_task(_flush_after(WRITE_BEHIND_DELAY))
     logger.info(f"Character updated: {character.id}")
     return character
 
-def delete_character(character_id: UUID) -> bool:
-    """Delete a character and its associated image files."""
-    characters = _read_storage()
-    if character_id not in characters:
-        logger.warning(f"Attempted to delete non-existent character: {character_id}")
-        return False
-
-    # Delete character image directory
-    character_dir = os.path.join(settings.IMAGE_STORAGE_PATH, str(character_id))
-    if os.path.exists(character_dir):
+async def _flush_after(delay: float):
+    """Background task: wait for more updates to accumulate, then flush them."""
+    global _FLUSH_TASK
+    await asyncio.sleep(delay)
+    _FLUSH_TASK = None  # Updates arriving from now on schedule a new flush
+    try:
+        await flush()
+    except HTTPException:
+        logger.error(f"Write-behind flush failed; retrying {len(_PENDING)} pending updates "
+                     f"in {WRITE_BEHIND_RETRY_DELAY}s")
+        if _PENDING and _FLUSH_TASK is None:
+            _FLUSH_TASK = asyncio.create_task(_flush_after(WRITE_BEHIND_RETRY_DELAY))
+
+async def flush():
+    """Write all pending character updates to the storage file in one write."""
+    async with _write_lock:
+        if not _PENDING:
+            return
+        pending = dict(_PENDING)
+        _PENDING.clear()
+        characters, index = await _load_storage()
+        for character_id, character in pending.items():
+            previous = characters.get(character_id)
+            if previous is None:
+                continue  # Deleted (possibly by another process) since the update
+            if previous.created_at != character.created_at:
+                index.remove(_index_key(previous))
+                bisect.insort(index, _index_key(character))
+            characters[character_id] = character
         try:
-            shutil.rmtree(character_dir)
-            logger.info(f"Deleted image directory: {character_dir}")
-        except OSError as e:
-            logger.error(f"Error deleting directory {character_dir}: {e}")
-            # Continue to delete DB entry but log the error
-
-    # Remove from storage dictionary
-    del characters[character_id]
-    _write_storage(characters)
+            await _write_storage(characters, index)
+        except HTTPException:
+            # Keep the updates for the next flush unless newer ones replaced them
+            for character_id, character in pending.items():
+                _PENDING.setdefault(character_id, character)
+            raise
+    logger.info(f"Flushed {len(pending)} pending character updates")
+
+async def delete_character(character_id: UUID) -> bool:
+    """Delete a character and its associated image files."""
+    async with _write_lock:
+        characters, index = await _load_storage()
+        if character_id not in characters:
+            logger.warning(f"Attempted to delete non-existent character: {character_id}")
+            return False
+
+        # Delete character image directory
+        character_dir = os.path.join(settings.IMAGE_STORAGE_PATH, str(character_id))
+        if os.path.exists(character_dir):
+            try:
+                await anyio.to_thread.run_sync(shutil.rmtree, character_dir)
+                logger.info(f"Deleted image directory: {character_dir}")
+            except OSError as e:
+                logger.error(f"Error deleting directory {character_dir}: {e}")
+                # Continue to delete DB entry but log the error
+
+        # Remove from storage dictionary, the sorted index and any pending update
+        index.remove(_index_key(characters.pop(character_id)))
+        _PENDING.pop(character_id, None)
+        await _write_storage(characters, index)
     logger.info(f"Character deleted from storage: {character_id}")
-    return True 
\ No newline at end of file
+    return True
@@ -0,0 +1,309 @@
+import anyio
+import orjson
+import os
+import shutil
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import AsyncIterator, Callable, List, Optional
+from uuid import UUID
+from fastapi import HTTPException
+
+from ..models.character import Character, CharacterSummary, ImageVariation, utcnow
+from ..core.config import get_settings
+from .file_storage import STORAGE_FILE
+
+# SQLite-backed storage. Summary fields are plain columns on `characters`, so the
+# list endpoint never touches the (potentially large) variation data; variations
+# live one row each in `variations` and are only loaded for single-character reads.
+# Writes share one connection under a lock; reads use a connection per worker thread,
+# so with WAL mode they proceed while a write is in progress.
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+DATABASE_FILE = settings.DATABASE_PATH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    description TEXT NOT NULL,
+    base_image_path TEXT,
+    image_seed INTEGER,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_characters_created_at ON characters (created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS variations (
+    character_id TEXT NOT NULL REFERENCES characters(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    json TEXT NOT NULL,
+    PRIMARY KEY (character_id, position)
+);
+"""
+_SUMMARY_COLUMNS = "id, name, description, base_image_path, image_seed, created_at, updated_at"
+_LIST_ORDER = "ORDER BY created_at DESC, id DESC"  # id breaks ties so keyset paging is stable
+_STREAM_PAGE_SIZE = 100  # Rows fetched per query while streaming the character list
+
+# PRAGMA user_version once the legacy JSON file has been considered for import
+_LEGACY_IMPORTED_VERSION = 1
+
+def _connect(check_same_thread: bool = True) -> sqlite3.Connection:
+    conn = sqlite3.connect(DATABASE_FILE, check_same_thread=check_same_thread, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+_lock = threading.Lock()  # Serializes writes on the shared write connection
+_conn = _connect(check_same_thread=False)
+_conn.execute("PRAGMA journal_mode=WAL")
+_conn.execute("PRAGMA synchronous=NORMAL")
+_readers = threading.local()  # One read connection per worker thread, kept for the thread's lifetime
+
+def _reader() -> sqlite3.Connection:
+    conn = getattr(_readers, "conn", None)
+    if conn is None:
+        conn = _readers.conn = _connect()
+    return conn
+
+
+def _write_variations(conn: sqlite3.Connection, character: Character):
+    """Bring the stored variation rows of a character in line with it (inside a transaction).
+
+    Rows before the first changed position are kept, so appending a variation writes one row.
+    """
+    character_id = str(character.id)
+    stored = [row["json"] for row in conn.execute(
+        "SELECT json FROM variations WHERE character_id = ? ORDER BY position", (character_id,)
+    )]
+    current = [v.model_dump_json() for v in character.variations]
+    unchanged = 0
+    while unchanged < min(len(stored), len(current)) and stored[unchanged] == current[unchanged]:
+        unchanged += 1
+    if unchanged < len(stored):
+        conn.execute("DELETE FROM variations WHERE character_id = ? AND position >= ?", (character_id, unchanged))
+    conn.executemany(
+        "INSERT INTO variations (character_id, position, json) VALUES (?, ?, ?)",
+        [(character_id, i, current[i]) for i in range(unchanged, len(current))],
+    )
+
+def _upsert_character(conn: sqlite3.Connection, character: Character):
+    """Insert or overwrite a character and its variations (inside a transaction)."""
+    conn.execute(
+        f"""
+        INSERT INTO characters ({_SUMMARY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name,
+            description = excluded.description,
+            base_image_path = excluded.base_image_path,
+            image_seed = excluded.image_seed,
+            created_at = excluded.created_at,
+            updated_at = excluded.updated_at
+        """,
+        (str(character.id), character.name, character.description, character.base_image_path,
+         character.image_seed, character.created_at.isoformat(), character.updated_at.isoformat()),
+    )
+    _write_variations(conn, character)
+
+def _update_existing_character(conn: sqlite3.Connection, character: Character) -> bool:
+    """Overwrite a stored character (inside a transaction). Returns False if it does not exist."""
+    cursor = conn.execute(
+        """
+        UPDATE characters SET name = ?, description = ?, base_image_path = ?, image_seed = ?, updated_at = ?
+        WHERE id = ?
+        """,
+        (character.name, character.description, character.base_image_path, character.image_seed,
+         character.updated_at.isoformat(), str(character.id)),
+    )
+    if cursor.rowcount == 0:
+        return False
+    _write_variations(conn, character)
+    return True
+
+def _load_character(conn: sqlite3.Connection, character_id: str) -> Optional[Character]:
+    """Read a character with its variations (inside a transaction, for a consistent snapshot)."""
+    row = conn.execute(f"SELECT {_SUMMARY_COLUMNS} FROM characters WHERE id = ?", (character_id,)).fetchone()
+    if not row:
+        return None
+    variation_rows = conn.execute(
+        "SELECT json FROM variations WHERE character_id = ? ORDER BY position", (character_id,)
+    ).fetchall()
+    return Character(
+        **dict(row),
+        variations=[ImageVariation.model_validate_json(v["json"]) for v in variation_rows],
+    )
+
+def _run_transaction(conn: sqlite3.Connection, fn: Callable, *args):
+    conn.execute("BEGIN")
+    try:
+        result = fn(conn, *args)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return result
+
+def _in_transaction(fn: Callable, *args):
+    """Run fn(conn, *args) in a write transaction on the shared connection (called from a worker thread)."""
+    with _lock:
+        return _run_transaction(_conn, fn, *args)
+
+def _in_read_transaction(fn: Callable, *args):
+    """Run fn(conn, *args) in a read transaction on this thread's connection (called from a worker thread)."""
+    return _run_transaction(_reader(), fn, *args)
+
+async def _transaction(fn: Callable, *args):
+    """Run a transactional write helper off the event loop."""
+    return await anyio.to_thread.run_sync(_in_transaction, fn, *args)
+
+async def _read_transaction(fn: Callable, *args):
+    """Run a transactional read helper off the event loop."""
+    return await anyio.to_thread.run_sync(_in_read_transaction, fn, *args)
+
+def _fetch_all(sql: str, params: tuple) -> List[sqlite3.Row]:
+    return _reader().execute(sql, params).fetchall()
+
+def _execute(sql: str, params: tuple) -> int:
+    with _lock:
+        return _conn.execute(sql, params).rowcount
+
+async def _query(sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+    """Run a read query off the event loop and return all rows."""
+    return await anyio.to_thread.run_sync(_fetch_all, sql, params)
+
+async def _write(sql: str, params: tuple = ()) -> int:
+    """Run a single write statement off the event loop. Returns the affected row count."""
+    return await anyio.to_thread.run_sync(_execute, sql, params)
+
+
+def _insert_imported(conn: sqlite3.Connection, characters: List[Character], source: str):
+    """Store characters migrated from an older storage format (inside a transaction)."""
+    for character in characters:
+        _upsert_character(conn, character)
+    conn.execute(f"PRAGMA user_version = {_LEGACY_IMPORTED_VERSION}")
+    logger.info(f"Imported {len(characters)} characters from {source} into {DATABASE_FILE}")
+
+def _import_legacy_json():
+    """Copy characters from the legacy JSON file into the database (one-time migration).
+
+    user_version records that the import ran, so characters deleted later are not
+    brought back from the JSON file on the next start.
+    """
+    if _conn.execute("PRAGMA user_version").fetchone()[0] >= _LEGACY_IMPORTED_VERSION:
+        return
+    if not os.path.exists(STORAGE_FILE):
+        _conn.execute(f"PRAGMA user_version = {_LEGACY_IMPORTED_VERSION}")
+        return
+    try:
+        data = orjson.loads(Path(STORAGE_FILE).read_bytes())
+    except (orjson.JSONDecodeError, IOError) as e:
+        logger.error(f"Error reading legacy storage file {STORAGE_FILE}: {e}")
+        return
+
+    characters = []
+    for k, v in data.items():
+        try:
+            characters.append(Character.model_validate(v))
+        except Exception as parse_error:
+            logger.error(f"Failed to parse character data for key {k}: {parse_error}")
+    _in_transaction(_insert_imported, characters, STORAGE_FILE)
+
+_conn.executescript(_SCHEMA)
+_import_legacy_json()
+
+
+async def save_character(character: Character) -> Character:
+    """Save a new or updated character to storage."""
+    now = utcnow()
+    if not character.created_at: character.created_at = now
+    character.updated_at = now  # Always set updated_at on save/update
+    try:
+        await _transaction(_upsert_character, character)
+    except sqlite3.Error as e:
+        logger.error(f"Error writing character {character.id} to {DATABASE_FILE}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save character data.")
+    logger.info(f"Character saved/updated: {character.id}")
+    return character
+
+async def get_character(character_id: UUID) -> Optional[Character]:
+    """Get a character by ID, including its variations."""
+    try:
+        character = await _read_transaction(_load_character, str(character_id))
+    except sqlite3.Error as e:
+        logger.error(f"Error reading character {character_id} from {DATABASE_FILE}: {e}")
+        return None
+    if not character:
+        logger.warning(f"Character not found: {character_id}")
+        return None
+    logger.info(f"Character retrieved: {character_id}")
+    return character
+
+async def iter_characters_json(limit: Optional[int] = None, offset: int = 0) -> AsyncIterator[bytes]:
+    """Yield character summaries as JSON objects, newest first, fetching rows a page at a time.
+
+    Only the first page uses OFFSET; later pages continue after the last (created_at, id)
+    seen, so rows inserted or deleted mid-stream neither repeat nor drop other rows.
+    """
+    remaining = limit
+    count = 0
+    last_row = None
+    while remaining is None or remaining > 0:
+        page_size = _STREAM_PAGE_SIZE if remaining is None else min(_STREAM_PAGE_SIZE, remaining)
+        if last_row is None:
+            sql = f"SELECT {_SUMMARY_COLUMNS} FROM characters {_LIST_ORDER} LIMIT ? OFFSET ?"
+            params = (page_size, offset)
+        else:
+            sql = f"SELECT {_SUMMARY_COLUMNS} FROM characters WHERE (created_at, id) < (?, ?) {_LIST_ORDER} LIMIT ?"
+            params = (last_row["created_at"], last_row["id"], page_size)
+        rows = await _query(sql, params)
+        for row in rows:
+            try:
+                yield CharacterSummary.model_validate(dict(row)).model_dump_json().encode()
+                count += 1
+            except Exception as parse_error:
+                logger.error(f"Failed to parse stored character row {row['id']}: {parse_error}")
+        if len(rows) < page_size:
+            break
+        last_row = rows[-1]
+        if remaining is not None:
+            remaining -= len(rows)
+    logger.info(f"Streamed {count} characters.")
+
+
+async def update_character(character: Character) -> Optional[Character]:
+    """Update an existing character. Returns updated character or None if not found."""
+    character.updated_at = utcnow()
+    try:
+        updated = await _transaction(_update_existing_character, character)
+    except sqlite3.Error as e:
+        logger.error(f"Error updating character {character.id} in {DATABASE_FILE}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save character data.")
+    if not updated:
+        logger.warning(f"Attempted to update non-existent character: {character.id}")
+        return None
+    logger.info(f"Character updated: {character.id}")
+    return character
+
+async def delete_character(character_id: UUID) -> bool:
+    """Delete a character and its associated image files."""
+    try:
+        # Variation rows are removed by ON DELETE CASCADE
+        rowcount = await _write("DELETE FROM characters WHERE id = ?", (str(character_id),))
+    except sqlite3.Error as e:
+        logger.error(f"Error deleting character {character_id} from {DATABASE_FILE}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete character data.")
+    if rowcount == 0:
+        logger.warning(f"Attempted to delete non-existent character: {character_id}")
+        return False
+    logger.info(f"Character deleted from storage: {character_id}")
+
+    # Delete character image directory
+    character_dir = os.path.join(settings.IMAGE_STORAGE_PATH, str(character_id))
+    if os.path.exists(character_dir):
+        try:
+            await anyio.to_thread.run_sync(shutil.rmtree, character_dir)
+            logger.info(f"Deleted image directory: {character_dir}")
+        except OSError as e:
+            logger.error(f"Error deleting directory {character_dir}: {e}")
+    return True
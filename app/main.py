@@ -1,14 +1,46 @@
 import os
+import asyncio
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 
 from .core.config import get_settings
 from .api.endpoints import characters
+from .services.image_generator import async_client, client as openai_client
+from .db import file_storage
 
 settings = get_settings()
-app = FastAPI(title=settings.APP_NAME, version="0.1.0")
+app = FastAPI(title=settings.APP_NAME, version="0.1.0", default_response_class=ORJSONResponse)
+
+# Cap concurrent API requests so a burst cannot spawn unbounded image generations
+# and storage writes; excess requests get 503 instead of queueing indefinitely.
+# A plain ASGI middleware (not @app.middleware("http")) so the permit is held until the
+# response body has been sent, including the streamed character list.
+class InflightLimitMiddleware:
+    def __init__(self, app, path_prefix: str, max_inflight: int):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.semaphore = asyncio.Semaphore(max_inflight)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=0.01)
+        except asyncio.TimeoutError:
+            response = JSONResponse({"detail": "Server busy, please retry later."}, status_code=503)
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.semaphore.release()
+
+# Registered before CORS so the (outer) CORS middleware also covers 503 responses.
+app.add_middleware(InflightLimitMiddleware, path_prefix=characters.router.prefix, max_inflight=settings.MAX_INFLIGHT)
 
 # CORS Middleware
 app.add_middleware(
@@ -39,6 +71,18 @@ async def root(request: Request):
     """Serves the main HTML page."""
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Close pooled HTTP connections on shutdown."""
+    await async_client.aclose()
+    await openai_client.close()
+
+@app.on_event("shutdown")
+async def flush_pending_writes():
+    """Write out coalesced character updates (JSON storage backend) before exiting."""
+    if settings.STORAGE_BACKEND == "json":
+        await file_storage.flush()
+
 # Health check endpoint
 @app.get("/health", tags=["Health"])
 async def health_check():
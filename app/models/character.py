@@ -1,8 +1,20 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, List, Optional
+from datetime import datetime, timezone
 from uuid import UUID, uuid4
 
+def utcnow() -> datetime:
+    """Current time as a timezone-aware UTC datetime."""
+    return datetime.now(timezone.utc)
+
+def _ensure_utc(value: datetime) -> datetime:
+    # Records written before timestamps were stored in UTC are naive local times
+    # (datetime.now()); astimezone reads a naive value as local time and converts it,
+    # so old records stay comparable with (and sortable against) newer aware ones.
+    return value.astimezone(timezone.utc)
+
+UTCDateTime = Annotated[datetime, AfterValidator(_ensure_utc)]
+
 class CharacterBase(BaseModel):
     description: str
     name: Optional[str] = None
@@ -15,12 +27,20 @@ class ImageVariation(BaseModel):
     pose: Optional[str] = None
     expression: Optional[str] = None
     setting: Optional[str] = None
-    generated_at: datetime = Field(default_factory=datetime.now)
+    generated_at: UTCDateTime = Field(default_factory=utcnow)
+
+class VariationRequest(BaseModel):
+    pose: Optional[str] = None
+    expression: Optional[str] = None
+    setting: Optional[str] = None
 
-class Character(CharacterBase):
+class CharacterSummary(CharacterBase):
+    """Character fields shown in list views (everything except variations)."""
     id: UUID = Field(default_factory=uuid4)
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)  # Timestamp for updates
+    created_at: UTCDateTime = Field(default_factory=utcnow)
+    updated_at: UTCDateTime = Field(default_factory=utcnow)  # Timestamp for updates
     base_image_path: Optional[str] = None
     image_seed: Optional[int] = None  # Store the seed used for image generation
+
+class Character(CharacterSummary):
     variations: List[ImageVariation] = [] 
\ No newline at end of file
@@ -1,13 +1,19 @@
 import os
+import asyncio
+import hashlib
+import aiofiles
+import aiofiles.os
 import httpx
 import logging
 import random
-from openai import OpenAI
+from functools import lru_cache
+from cachetools import TTLCache
+from openai import AsyncOpenAI
 from fastapi import HTTPException
 from ..core.config import get_settings
-from ..models.character import Character, ImageVariation
-from datetime import datetime
-from typing import Optional, Dict
+from ..models.character import Character, ImageVariation, utcnow
+from typing import Optional, Dict, Set, Tuple
+from uuid import UUID
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO)
@@ -18,35 +24,87 @@ settings = get_settings()
 if not settings.OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY not found in environment variables")
 
+# Generated images are saved under IMAGE_STORAGE_PATH and served from STATIC_FILES_DIR,
+# so their web path is the file path with the static prefix sliced off.
+_STATIC_PREFIX = settings.STATIC_FILES_DIR.rstrip(os.sep) + os.sep
+if not settings.IMAGE_STORAGE_PATH.startswith(_STATIC_PREFIX):
+    raise ValueError("IMAGE_STORAGE_PATH must be inside STATIC_FILES_DIR")
+_STATIC_PREFIX_LEN = len(_STATIC_PREFIX)
+
 # Add debugging to check the API key
 api_key_prefix = settings.OPENAI_API_KEY[:10] if settings.OPENAI_API_KEY else "None"
 logger.info(f"Using OpenAI API key with prefix: {api_key_prefix}...")
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-# Create an async HTTP client
-async_client = httpx.AsyncClient()
+# Async client so the multi-second image generation call yields to the event loop
+client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+
+# Shared async HTTP client, reused across requests so image downloads keep pooled
+# (HTTP/2, keep-alive) connections instead of opening a new one each time.
+# Closed by the application's shutdown hook.
+async_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30.0),
+    timeout=httpx.Timeout(60.0, connect=10.0),
+)
+
+IMAGE_SIZE = "1024x1024"
+
+# Relative paths of images already generated for a (character id, prompt/seed/size digest).
+# create_prompt is deterministic, so an identical request with the same seed can reuse
+# the stored file instead of another OpenAI round trip and download. Entries are keyed
+# on the seed stored for the character, so only variations of seeded characters are
+# cached (the pinned client may not forward the seed, but the request is still identical).
+_generation_cache: "TTLCache[Tuple[str, str], str]" = TTLCache(maxsize=1024, ttl=86400)
+_generation_cache_lock = asyncio.Lock()
+
+# Image folders already created by this process, so the common case skips makedirs
+_ENSURED_DIRS: Set[str] = set()
+
+def _generation_cache_key(character: Character, prompt: str, seed: Optional[int]) -> Tuple[str, str]:
+    digest = hashlib.blake2b(f"{prompt}|{seed}|{IMAGE_SIZE}".encode(), digest_size=16).hexdigest()
+    return (str(character.id), digest)
+
+async def forget_character_images(character_id: UUID):
+    """Drop cached generation results and known image folders for a deleted character."""
+    prefix = str(character_id)
+    async with _generation_cache_lock:
+        for key in [key for key in _generation_cache if key[0] == prefix]:
+            _generation_cache.pop(key, None)
+    character_dir = os.path.join(settings.IMAGE_STORAGE_PATH, prefix)
+    _ENSURED_DIRS.discard(character_dir)
+    _ENSURED_DIRS.discard(os.path.join(character_dir, "variations"))
+
+async def _remove_partial_file(file_path: str):
+    """Remove an image file left incomplete by a failed download."""
+    try:
+        await aiofiles.os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+# Fixed parts of every prompt, with very explicit consistency instructions
+_PROMPT_PREFIX = "I NEED to test how the tool works with extremely simple prompts. DO NOT add any detail, just use it AS-IS: Character ID '"
+_PROMPT_SUBJECT = "' - Create a portrait of this specific character: "
+_PROMPT_SUFFIX = ". IMPORTANT: This MUST be exactly the same character as previous images with the same Character ID. Maintain perfect consistency in the character's core features including face, body type, hair style, clothing style, and all distinctive characteristics. Use identical art style to previous generations."
+
+@lru_cache(maxsize=1024)
+def _build_prompt(character_id_short: str, description: str, pose: Optional[str], expression: Optional[str], setting: Optional[str]) -> str:
+    parts = [_PROMPT_PREFIX, character_id_short, _PROMPT_SUBJECT, description]
+    if pose:
+        parts.append(f". Pose: {pose}")
+    if expression:
+        parts.append(f". Expression: {expression}")
+    if setting:
+        parts.append(f". Setting: {setting}")
+    parts.append(_PROMPT_SUFFIX)
+    return "".join(parts)
 
 def create_prompt(character: Character, variation_params: Optional[Dict] = None) -> str:
     """Create a prompt for image generation based on character description and variations"""
     # Add a unique identifier to help with consistency (seed substitute)
     character_id_short = str(character.id)[:8]
-    
-    # Start with very explicit consistency instructions
-    base_prompt = f"I NEED to test how the tool works with extremely simple prompts. DO NOT add any detail, just use it AS-IS: Character ID '{character_id_short}' - Create a portrait of this specific character: {character.description}"
-
-    if variation_params:
-        if variation_params.get("pose"):
-            base_prompt += f". Pose: {variation_params['pose']}"
-        if variation_params.get("expression"):
-            base_prompt += f". Expression: {variation_params['expression']}"
-        if variation_params.get("setting"):
-            base_prompt += f". Setting: {variation_params['setting']}"
-
-    # Add enhanced style guidance for consistency
-    base_prompt += ". IMPORTANT: This MUST be exactly the same character as previous images with the same Character ID. Maintain perfect consistency in the character's core features including face, body type, hair style, clothing style, and all distinctive characteristics. Use identical art style to previous generations."
-
-    return base_prompt
+    params = variation_params or {}
+    return _build_prompt(character_id_short, character.description,
+                         params.get("pose"), params.get("expression"), params.get("setting"))
 
 async def generate_character_image(character: Character, variation_params: Optional[Dict] = None) -> str:
     """Generate a character image using GPT-4o, download it, and save it."""
@@ -55,6 +113,7 @@ async def generate_character_image(character: Character, variation_params: Optio
 
     try:
         # Determine the seed to use
+        seed = None  # Variations of a character without a stored seed are generated unseeded
         if variation_params and character.image_seed is not None:
             # For variations, note the seed for reference (may or may not be used)
             seed = character.image_seed
@@ -65,13 +124,24 @@ async def generate_character_image(character: Character, variation_params: Optio
             character.image_seed = seed
             logger.info(f"Generated new seed {seed} for base character image (if supported)")
 
+        # A base image always gets a fresh seed, so only variations can repeat a request
+        cacheable = bool(variation_params) and seed is not None
+        cache_key = _generation_cache_key(character, prompt, seed)
+        cached_path = None
+        if cacheable:
+            async with _generation_cache_lock:
+                cached_path = _generation_cache.get(cache_key)
+        if cached_path and os.path.exists(os.path.join(settings.STATIC_FILES_DIR, cached_path)):
+            logger.info(f"Reusing previously generated image {cached_path} for identical prompt and seed")
+            return cached_path
+
         # Try to use the seed parameter, but fallback if not supported
         try:
             # Attempt to use the seed parameter
-            response = client.images.generate(
+            response = await client.images.generate(
                 model="dall-e-3",
                 prompt=prompt,
-                size="1024x1024",
+                size=IMAGE_SIZE,
                 quality="standard",
                 n=1,
                 seed=seed
@@ -81,10 +151,10 @@ async def generate_character_image(character: Character, variation_params: Optio
             if "unexpected keyword argument 'seed'" in str(e):
                 # Seed parameter not supported in this version, use without seed
                 logger.warning("Seed parameter not supported in this OpenAI client version, generating without seed")
-                response = client.images.generate(
+                response = await client.images.generate(
                     model="dall-e-3",
                     prompt=prompt,
-                    size="1024x1024",
+                    size=IMAGE_SIZE,
                     quality="standard",
                     n=1
                 )
@@ -106,21 +176,8 @@ async def generate_character_image(character: Character, variation_params: Optio
 
         logger.info(f"Image generated, URL: {image_url}")
 
-        # Download the image using httpx
-        try:
-            image_response = await async_client.get(image_url, timeout=60.0)
-            image_response.raise_for_status()
-            image_data = image_response.content
-            logger.info(f"Image downloaded successfully from URL.")
-        except httpx.HTTPStatusError as e:
-             logger.error(f"HTTP error downloading image: {e.response.status_code} - {e.response.text}")
-             raise HTTPException(status_code=500, detail=f"Failed to download image from OpenAI: Status {e.response.status_code}")
-        except httpx.RequestError as e:
-             logger.error(f"Request error downloading image: {e}")
-             raise HTTPException(status_code=500, detail=f"Failed to download image from OpenAI: Request Error")
-
-        # Create file path and save the image
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        # Create file path for the image
+        timestamp = utcnow().strftime('%Y%m%d%H%M%S%f')
         file_name = f"{character.id}_{timestamp}.png"
 
         if variation_params:
@@ -130,20 +187,39 @@ async def generate_character_image(character: Character, variation_params: Optio
             # Store base image in the character's main folder
             folder_path = os.path.join(settings.IMAGE_STORAGE_PATH, str(character.id))
 
-        os.makedirs(folder_path, exist_ok=True)
+        if folder_path not in _ENSURED_DIRS:
+            await aiofiles.os.makedirs(folder_path, exist_ok=True)
+            _ENSURED_DIRS.add(folder_path)
         file_path = os.path.join(folder_path, file_name)
 
+        # Stream the image straight to disk instead of buffering the whole PNG in memory
         try:
-            with open(file_path, "wb") as f:
-                f.write(image_data)
-            logger.info(f"Image saved to {file_path}")
+            async with async_client.stream("GET", image_url, timeout=60.0) as image_response:
+                image_response.raise_for_status()
+                async with aiofiles.open(file_path, "wb") as f:
+                    async for chunk in image_response.aiter_bytes(65536):
+                        await f.write(chunk)
+            logger.info(f"Image downloaded and saved to {file_path}")
+        except httpx.HTTPStatusError as e:
+             logger.error(f"HTTP error downloading image: {e.response.status_code}")
+             raise HTTPException(status_code=500, detail=f"Failed to download image from OpenAI: Status {e.response.status_code}")
+        except httpx.RequestError as e:
+             await _remove_partial_file(file_path)
+             logger.error(f"Request error downloading image: {e}")
+             raise HTTPException(status_code=500, detail=f"Failed to download image from OpenAI: Request Error")
         except IOError as e:
+            await _remove_partial_file(file_path)
             logger.error(f"Failed to save image to disk: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to save image file.")
 
         # Create relative path for storage in the model and web access
-        relative_path = os.path.relpath(file_path, settings.STATIC_FILES_DIR)
-        relative_path = relative_path.replace(os.sep, '/')  # Ensure web-compatible path separators
+        relative_path = file_path[_STATIC_PREFIX_LEN:]
+        if os.sep != '/':
+            relative_path = relative_path.replace(os.sep, '/')  # Ensure web-compatible path separators
+
+        if cacheable:
+            async with _generation_cache_lock:
+                _generation_cache[cache_key] = relative_path
 
         return relative_path
 
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import tempfile
+import threading
+import types
+
+import httpx
+import pytest
+
+# Settings are read when the app modules are first imported, so point every path at a
+# scratch directory before that happens; tests never touch the real database or images.
+_SCRATCH_DIR = tempfile.mkdtemp(prefix="character-gen-tests-")
+os.environ["OPENAI_API_KEY"] = "sk-test"
+os.environ["DATABASE_PATH"] = os.path.join(_SCRATCH_DIR, "characters.db")
+os.environ["STATIC_FILES_DIR"] = os.path.join(_SCRATCH_DIR, "static")
+os.environ["IMAGE_STORAGE_PATH"] = os.path.join(_SCRATCH_DIR, "static", "images")
+
+from app.db import file_storage, sqlite_storage  # noqa: E402
+from app.services import image_generator  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-manual", action="store_true", default=False,
+        help="run tests marked manual (they call the real OpenAI API)",
+    )
+
+def pytest_collection_modifyitems(config, items):
+    """Skip manual tests unless --run-manual is given, so a plain `pytest` run still passes."""
+    if config.getoption("--run-manual"):
+        return
+    skip_manual = pytest.mark.skip(reason="calls the OpenAI API; run with --run-manual")
+    for item in items:
+        if "manual" in item.keywords:
+            item.add_marker(skip_manual)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"  # Write-behind and the generation cache use asyncio primitives
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A fresh SQLite database for the sqlite_storage module, with no legacy JSON file."""
+    monkeypatch.setattr(sqlite_storage, "DATABASE_FILE", str(tmp_path / "characters.db"))
+    monkeypatch.setattr(sqlite_storage, "STORAGE_FILE", str(tmp_path / "characters_db.json"))
+    conn = sqlite_storage._connect(check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(sqlite_storage._SCHEMA)
+    monkeypatch.setattr(sqlite_storage, "_conn", conn)
+    monkeypatch.setattr(sqlite_storage, "_readers", threading.local())
+    yield sqlite_storage
+    conn.close()
+
+@pytest.fixture
+def json_store(tmp_path, monkeypatch):
+    """An empty JSON storage file for the file_storage module."""
+    monkeypatch.setattr(file_storage, "STORAGE_FILE", str(tmp_path / "characters_db.json"))
+    monkeypatch.setattr(file_storage, "LOCK_FILE", str(tmp_path / "characters_db.json.lock"))
+    monkeypatch.setattr(file_storage, "_CACHE", None)
+    monkeypatch.setattr(file_storage, "_PENDING", {})
+    monkeypatch.setattr(file_storage, "_FLUSH_TASK", None)
+    monkeypatch.setattr(file_storage, "_write_lock", asyncio.Lock())
+    return file_storage
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Replace the OpenAI client and the image download with fakes.
+
+    Like the pinned openai client, images.generate takes no seed. Prompts containing
+    "explode" fail. Returns the list of prompts sent.
+    """
+    prompts = []
+
+    async def generate(model, prompt, size, quality, n):
+        prompts.append(prompt)
+        if "explode" in prompt:
+            raise RuntimeError("image generation failed")
+        return types.SimpleNamespace(data=[types.SimpleNamespace(url=f"https://images.test/{len(prompts)}.png")])
+
+    monkeypatch.setattr(image_generator, "client", types.SimpleNamespace(images=types.SimpleNamespace(generate=generate)))
+    monkeypatch.setattr(image_generator, "async_client", httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b"PNG"))
+    ))
+    monkeypatch.setattr(image_generator, "_generation_cache", image_generator.TTLCache(maxsize=1024, ttl=86400))
+    monkeypatch.setattr(image_generator, "_generation_cache_lock", asyncio.Lock())
+    return prompts
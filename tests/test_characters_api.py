@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import get_settings
+from app.main import InflightLimitMiddleware, app
+
+settings = get_settings()
+HEADERS = {"X-API-Key": settings.API_KEY}
+
+
+@pytest.fixture
+def client(sqlite_db, fake_openai):
+    return TestClient(app)
+
+@pytest.fixture
+def character_id(client):
+    response = client.post("/api/characters/", json={"description": "A pirate"}, headers=HEADERS)
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_batch_keeps_successful_variations(client, character_id, fake_openai):
+    variations = [{"pose": "standing"}, {"pose": "explode"}, {"expression": "smiling"}]
+    response = client.post(f"/api/characters/{character_id}/variations/batch", json=variations, headers=HEADERS)
+
+    assert response.status_code == 200
+    stored = response.json()["variations"]
+    assert [(v["pose"], v["expression"]) for v in stored] == [("standing", None), (None, "smiling")]
+    assert len(fake_openai) == 4  # Base image and all three variations were attempted
+    assert client.get(f"/api/characters/{character_id}", headers=HEADERS).json()["variations"] == stored
+
+def test_batch_fails_when_every_variation_fails(client, character_id):
+    response = client.post(f"/api/characters/{character_id}/variations/batch",
+                           json=[{"pose": "explode"}], headers=HEADERS)
+    assert response.status_code == 500
+    assert client.get(f"/api/characters/{character_id}", headers=HEADERS).json()["variations"] == []
+
+def test_batch_rejects_more_than_max_variations(client, character_id, fake_openai):
+    variations = [{"pose": f"pose {i}"} for i in range(settings.MAX_BATCH_VARIATIONS + 1)]
+    response = client.post(f"/api/characters/{character_id}/variations/batch", json=variations, headers=HEADERS)
+    assert response.status_code == 422
+    assert len(fake_openai) == 1  # Only the base image
+
+def test_repeated_variation_reuses_generated_image(client, character_id, fake_openai):
+    for _ in range(2):
+        response = client.post(f"/api/characters/{character_id}/variations?pose=sitting", headers=HEADERS)
+        assert response.status_code == 200
+    assert len(response.json()["variations"]) == 1
+    assert len(fake_openai) == 2
+
+
+@pytest.mark.anyio
+async def test_inflight_limit_answers_503_until_the_body_is_sent():
+    body_started = asyncio.Event()
+    finish_body = asyncio.Event()
+
+    async def slow_stream(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"[", "more_body": True})
+        body_started.set()
+        await finish_body.wait()
+        await send({"type": "http.response.body", "body": b"]"})
+
+    limited = InflightLimitMiddleware(slow_stream, path_prefix="/api/characters", max_inflight=1)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=limited), base_url="http://test") as http:
+        first = asyncio.create_task(http.get("/api/characters/"))
+        await body_started.wait()
+
+        # The permit is still held while the first response body is streaming
+        busy = await http.get("/api/characters/")
+        assert busy.status_code == 503
+        assert busy.json() == {"detail": "Server busy, please retry later."}
+
+        finish_body.set()
+        assert (await first).content == b"[]"
+        assert (await http.get("/api/characters/")).status_code == 200
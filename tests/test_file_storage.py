@@ -0,0 +1,62 @@
+import pytest
+from fastapi import HTTPException
+
+from app.models.character import Character, ImageVariation
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def counted_writes(json_store, monkeypatch):
+    """Count _write_storage calls; set failures to make that many calls fail first."""
+    original = json_store._write_storage
+    state = {"writes": 0, "failures": 0}
+
+    async def write_storage(characters, index):
+        state["writes"] += 1
+        if state["failures"]:
+            state["failures"] -= 1
+            raise HTTPException(status_code=500, detail="Failed to save character data.")
+        await original(characters, index)
+
+    monkeypatch.setattr(json_store, "_write_storage", write_storage)
+    return state
+
+async def _read_from_disk(json_store, character_id):
+    json_store._CACHE = None  # Force a re-read of the file
+    characters = await json_store._read_storage()
+    return characters.get(character_id)
+
+
+async def test_updates_are_coalesced_into_one_write(json_store, counted_writes):
+    character = Character(description="A wizard")
+    await json_store.save_character(character)
+    assert counted_writes["writes"] == 1
+
+    for i in range(5):
+        character = character.model_copy(deep=True)
+        character.variations.append(ImageVariation(image_path=f"images/{i}.png"))
+        await json_store.update_character(character)
+    # Reads see the pending update before it is written
+    assert len((await json_store.get_character(character.id)).variations) == 5
+
+    await json_store._FLUSH_TASK
+    assert counted_writes["writes"] == 2
+    assert len((await _read_from_disk(json_store, character.id)).variations) == 5
+
+async def test_failed_flush_is_retried(json_store, counted_writes, monkeypatch):
+    monkeypatch.setattr(json_store, "WRITE_BEHIND_RETRY_DELAY", 0.01)
+    character = Character(description="A bard")
+    await json_store.save_character(character)
+
+    character.name = "Renamed"
+    counted_writes["failures"] = 1
+    await json_store.update_character(character)
+    await json_store._FLUSH_TASK
+
+    assert json_store._PENDING  # Kept for the retry
+    retry = json_store._FLUSH_TASK
+    assert retry is not None
+    await retry
+    assert not json_store._PENDING
+    assert (await _read_from_disk(json_store, character.id)).name == "Renamed"
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
+from app.models.character import Character, ImageVariation
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_round_trip_keeps_variation_order(sqlite_db):
+    character = Character(description="A knight", name="Ser Test", image_seed=42,
+                          variations=[ImageVariation(image_path=f"images/{i}.png", pose=f"pose {i}") for i in range(3)])
+    await sqlite_db.save_character(character)
+
+    stored = await sqlite_db.get_character(character.id)
+    assert stored == character
+
+    stored.variations.insert(1, ImageVariation(image_path="images/new.png"))
+    stored.variations.pop()
+    stored.name = "Ser Renamed"
+    assert await sqlite_db.update_character(stored) is stored
+
+    reloaded = await sqlite_db.get_character(character.id)
+    assert reloaded.name == "Ser Renamed"
+    assert [v.image_path for v in reloaded.variations] == ["images/0.png", "images/new.png", "images/1.png"]
+
+    assert await sqlite_db.delete_character(character.id) is True
+    assert await sqlite_db.get_character(character.id) is None
+    assert await sqlite_db.delete_character(character.id) is False
+
+async def test_update_of_missing_character_returns_none(sqlite_db):
+    assert await sqlite_db.update_character(Character(description="Never saved")) is None
+
+@pytest.mark.parametrize("limit, offset", [(None, 0), (None, 5), (2, 1), (4, 2), (5, 0), (3, 10)])
+async def test_stream_pages_across_page_size(sqlite_db, monkeypatch, limit, offset):
+    monkeypatch.setattr(sqlite_db, "_STREAM_PAGE_SIZE", 3)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    characters = [Character(description=f"Character {i}", created_at=start + timedelta(minutes=i // 2)) for i in range(8)]
+    for character in characters:
+        await sqlite_db.save_character(character)
+
+    # Newest first; characters sharing a created_at are ordered by id
+    expected = sorted(characters, key=lambda c: (c.created_at, str(c.id)), reverse=True)
+    expected_ids = [str(c.id) for c in expected][offset:None if limit is None else offset + limit]
+    streamed = [orjson.loads(item) async for item in sqlite_db.iter_characters_json(limit=limit, offset=offset)]
+    assert [item["id"] for item in streamed] == expected_ids
+    assert all("variations" not in item for item in streamed)
+
+async def test_legacy_json_is_imported_only_once(sqlite_db):
+    legacy = [Character(description=f"Legacy {i}") for i in range(2)]
+    with open(sqlite_db.STORAGE_FILE, "wb") as f:
+        f.write(orjson.dumps({str(c.id): c.model_dump(mode="json") for c in legacy}))
+
+    sqlite_db._import_legacy_json()
+    assert [await sqlite_db.get_character(c.id) for c in legacy] == legacy
+
+    for character in legacy:
+        await sqlite_db.delete_character(character.id)
+    sqlite_db._import_legacy_json()  # Next start
+    assert [await sqlite_db.get_character(c.id) for c in legacy] == [None, None]